@@ -1,17 +1,29 @@
 #!/usr/bin/env python3
 # scraper_auto.py
 import os
-import json
+import re
+import math
+import struct
+import sqlite3
+import codecs
+import asyncio
+import hashlib
 import logging
-import time
 import random
-from concurrent.futures import ThreadPoolExecutor, as_completed
-from urllib.parse import urljoin
+import time
+from collections import namedtuple
+from functools import lru_cache
+from importlib.util import find_spec
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from urllib.parse import urljoin, urlparse
+import orjson
 from dotenv import load_dotenv
-from bs4 import BeautifulSoup
-from curl_cffi import requests
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
+from selectolax.lexbor import LexborHTMLParser
+from curl_cffi.requests import AsyncSession
+from curl_cffi.requests.exceptions import RequestException
+from email.message import EmailMessage
+from email import policy
 import smtplib
 
 # ======= 加载环境变量 (.env) =======
@@ -30,12 +42,17 @@ except ValueError:
     print(f"⚠️ Warning: invalid SMTP_PORT value '{smtp_port_raw}', defaulting to 587.")
     SMTP_PORT = 587
 
-RECIPIENT_EMAIL = os.getenv("RECIPIENT_EMAIL", EMAIL_USER)
+# RECIPIENT_EMAIL 支持逗号分隔的多个地址；收件人全部走信封（相当于 Bcc），一次 sendmail 发完
+RECIPIENTS = [a.strip() for a in (os.getenv("RECIPIENT_EMAIL") or EMAIL_USER or "").split(",") if a.strip()]
+RECIPIENT_BATCH = 400  # 部分服务商限制单封收件人数（Office365 为 500）
 INTERVAL_MINUTES = int(os.getenv("INTERVAL_MINUTES", 60))
 
 # ======= 数据与日志 =======
 DATA_DIR = "data"
-DATA_FILE = os.path.join(DATA_DIR, "last_items.json")
+SEEN_FILE = os.path.join(DATA_DIR, "seen.bloom")
+LEGACY_ITEMS_FILE = os.path.join(DATA_DIR, "last_items.json")  # 旧版本保存的上次商品列表，仅用于迁移
+ITEMS_FILE = os.path.join(DATA_DIR, "items.jsonl")
+CACHE_DB = os.path.join(DATA_DIR, "cache.sqlite")
 LOG_FILE = "scraper.log"
 os.makedirs(DATA_DIR, exist_ok=True)
 
@@ -45,189 +62,833 @@ logging.basicConfig(
     handlers=[logging.FileHandler(LOG_FILE, encoding="utf-8"), logging.StreamHandler()]
 )
 
-# ======= Playwright / APScheduler 可选依赖 =======
-try:
-    from playwright.sync_api import sync_playwright
-    PLAYWRIGHT_AVAILABLE = True
-except Exception:
-    PLAYWRIGHT_AVAILABLE = False
+# ======= Playwright / APScheduler / pyahocorasick 可选依赖 =======
+# Playwright 和 APScheduler 导入较慢，只检查是否安装，真正用到时才导入
+PLAYWRIGHT_AVAILABLE = find_spec("playwright") is not None
+APS_AVAILABLE = find_spec("apscheduler") is not None
+
+@lru_cache(maxsize=None)
+def _playwright():
+    from playwright.async_api import async_playwright
+    return async_playwright
+
+@lru_cache(maxsize=None)
+def _asyncio_scheduler():
+    from apscheduler.schedulers.asyncio import AsyncIOScheduler
+    return AsyncIOScheduler
 
 try:
-    from apscheduler.schedulers.background import BackgroundScheduler
-    APS_AVAILABLE = True
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
 except Exception:
-    APS_AVAILABLE = False
+    AHOCORASICK_AVAILABLE = False
 
 # ======= 目标配置 =======
 TARGET_BRANDS = ["Selmer", "Otto Link", "Dave Guardala", "Yanagisawa", "Beechler", "Yani", "Otto"]
 
-SITES = [
-    {"url": "https://www.getasax.com/collections/mouthpieces", "item": ".product-grid-item", "name": ".product-title", "price": ".price", "link": "a"},
+# 品牌匹配在导入时构建一次：有 pyahocorasick 时用自动机一次扫描全部品牌，
+# 否则用预编译的正则（对小写名称做区分大小写匹配，比 IGNORECASE 快得多）
+_BRANDS_LC = tuple(b.lower() for b in TARGET_BRANDS)
+BRAND_RE = re.compile("|".join(re.escape(b) for b in sorted(_BRANDS_LC, key=len, reverse=True)))
+if AHOCORASICK_AVAILABLE:
+    _AC = ahocorasick.Automaton()
+    for b in _BRANDS_LC:
+        _AC.add_word(b, b)
+    _AC.make_automaton()
+
+# 站点配置在导入时转成不可变的 SiteCfg，抓取 / 解析时按属性取值；可直接 pickle 给解析进程
+# dynamic=True 表示商品列表由 JS 渲染，HTML 兜底时直接用浏览器；缺省先试静态页
+SiteCfg = namedtuple(
+    "SiteCfg",
+    "url item name price link api json_path api_headers api_fields api_link_base dynamic scroll",
+    defaults=(None, "", None, None, None, False, False),
+)
+ApiFields = namedtuple("ApiFields", "name price link")
+
+def site_cfg(cfg):
+    # 嵌套的 dict 也换成不可变、可 pickle 的结构：字段路径用 ApiFields，请求头用 (名, 值) 元组
+    cfg = dict(cfg)
+    if cfg.get("api_fields"):
+        cfg["api_fields"] = ApiFields(**cfg["api_fields"])
+    if cfg.get("api_headers"):
+        cfg["api_headers"] = tuple(cfg["api_headers"].items())
+    return SiteCfg(**cfg)
+
+SITES = [site_cfg(s) for s in (
+    {"url": "https://www.getasax.com/collections/mouthpieces", "item": ".product-grid-item", "name": ".product-title", "price": ".price", "link": "a",
+     "api": "https://www.getasax.com/collections/mouthpieces/products.json?limit=250", "json_path": "products",
+     "api_fields": {"name": "title", "price": "variants.0.price", "link": "handle"}, "api_link_base": "https://www.getasax.com/products/"},
     {"url": "https://www.saxquest.com/", "item": ".product-listing", "name": ".product-title", "price": ".product-price", "link": "a"},
     {"url": "https://www.dcsax.com/", "item": ".product-item", "name": ".product-title", "price": ".price", "link": "a"},
     {"url": "https://www.soundfuga.jp/", "item": ".product-item", "name": ".product-title", "price": ".price", "link": "a"},
-    {"url": "https://www.reverb.com/marketplace?query=saxophone", "item": ".product-card", "name": ".product-card-title", "price": ".product-card-price", "link": "a"},
-]
+    {"url": "https://www.reverb.com/marketplace?query=saxophone", "item": ".product-card", "name": ".product-card-title", "price": ".product-card-price", "link": "a",
+     "api": "https://api.reverb.com/api/listings?query=saxophone&per_page=100", "json_path": "listings",
+     "api_headers": {"Accept": "application/hal+json", "Accept-Version": "3.0"}, "dynamic": True,
+     "api_fields": {"name": "title", "price": "price.display", "link": "_links.web.href"}},
+)]
 
+# curl_cffi 模拟 Chrome 的 TLS 指纹和默认请求头（含 User-Agent / Accept）
+# Accept-Encoding（gzip, deflate, br, zstd）也由模拟配置设置，libcurl 边读边解压，
+# 拿到的分块已是解压后的字节；HEADERS 里不再手动设置 Accept-Encoding，以免覆盖成更短的编码列表
+IMPERSONATE = "chrome124"
 HEADERS = {
-    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36",
-    "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
     "Accept-Language": "en-US,en;q=0.9",
-    "Connection": "keep-alive",
 }
 
 # ======= 抓取函数 =======
-def fetch_static_html(url, timeout=15):
+# 整个进程共用一个会话：调度模式下各次 run 在同一个事件循环里，连接池和 TLS 会话跨 run 复用
+_SESSION = None
+
+def get_session():
+    global _SESSION
+    if _SESSION is None:
+        _SESSION = AsyncSession(impersonate=IMPERSONATE, headers=HEADERS, max_clients=STATIC_WORKERS)
+    return _SESSION
+
+async def close_session():
+    global _SESSION
+    if _SESSION is not None:
+        await _SESSION.close()
+        _SESSION = None
+
+async def close_resources():
+    await close_session()
+    await close_browser()
+
+# 解析结果统一为不可变元组，下游过滤 / 去重 / 邮件直接读字段，不再回头解析页面
+Item = namedtuple("Item", "name price link source")
+
+NOT_MODIFIED = object()
+MAX_PAGE_BYTES = 5 * 1024 * 1024
+
+# 浏览器（WHATWG）认识而 Python codecs 不认识或含义不同的编码标签；
+# 日文站点常见的 Shift_JIS 各种写法实际都按 Windows-31J（cp932）解码
+CHARSET_ALIASES = {
+    "shift_jis": "cp932",
+    "shift-jis": "cp932",
+    "sjis": "cp932",
+    "x-sjis": "cp932",
+    "ms_kanji": "cp932",
+    "csshiftjis": "cp932",
+    "windows-31j": "cp932",
+    "x-euc-jp": "euc_jp",
+    "utf8mb4": "utf-8",
+}
+
+# 并发控制：全局上限 + 每个域名的上限，避免对同一站点发起过多请求
+# 静态请求只占带宽，可以开得较大；每个浏览器页面要占上百 MB 内存，动态渲染单独限流
+# 两个上限都可以用环境变量按机器配置调整
+def env_workers(name, default):
+    # 非整数回退到默认值；至少为 1，否则 Semaphore(0) 会让整个 run 永远卡住
+    raw = os.getenv(name, "").strip()
     try:
-        resp = requests.get(url, headers=HEADERS, timeout=timeout)
-        if resp.status_code == 200:
-            return resp.text
-        logging.warning(f"Static fetch {url} returned {resp.status_code}")
+        return max(1, int(raw)) if raw else default
+    except ValueError:
+        logging.warning(f"Invalid {name} value '{raw}', defaulting to {default}.")
+        return default
+
+STATIC_WORKERS = env_workers("STATIC_WORKERS", 32)
+DYNAMIC_WORKERS = env_workers("DYNAMIC_WORKERS", 2)
+HOST_CONCURRENCY = 2
+FETCH_RETRIES = 3
+_GLOBAL_SEM = None
+_DYNAMIC_SEM = None
+_HOST_SEMS = {}
+_PW_LOCK = None
+
+def reset_loop_state():
+    # Semaphore / Lock 绑定所在的事件循环，每次 run 都重新创建
+    global _GLOBAL_SEM, _DYNAMIC_SEM, _PW_LOCK
+    _GLOBAL_SEM = asyncio.Semaphore(STATIC_WORKERS)
+    _DYNAMIC_SEM = asyncio.Semaphore(DYNAMIC_WORKERS)
+    _HOST_SEMS.clear()
+    _PW_LOCK = asyncio.Lock()
+
+@asynccontextmanager
+async def limited(url):
+    host = urlparse(url).netloc
+    if host not in _HOST_SEMS:
+        _HOST_SEMS[host] = asyncio.Semaphore(HOST_CONCURRENCY)
+    async with _HOST_SEMS[host], _GLOBAL_SEM:
+        yield
+
+async def with_retries(attempt, url):
+    # 只对网络层异常（连接失败、超时、传输中断）做指数退避重试，最后一次仍失败则抛出；
+    # 解码等必然再次失败的错误直接抛出，不占着并发名额空等
+    for n in range(FETCH_RETRIES):
+        try:
+            return await attempt()
+        except RequestException as e:
+            if n == FETCH_RETRIES - 1:
+                raise
+            delay = 2 ** n + random.random()
+            logging.info(f"Retrying {url} in {delay:.1f}s after error: {e}")
+            await asyncio.sleep(delay)
+
+async def read_body(resp, url):
+    # 分块读取，超过 MAX_PAGE_BYTES 就停止读取，限制超大页面的内存峰值
+    chunks, size = [], 0
+    async for chunk in resp.aiter_content():
+        chunks.append(chunk)
+        size += len(chunk)
+        if size >= MAX_PAGE_BYTES:
+            logging.warning(f"{url} exceeds {MAX_PAGE_BYTES} bytes, parsing the first part only")
+            break
+    body = b"".join(chunks)
+    # 返回 (内容, 是否让解析器自己识别编码)。响应头声明的编码优先于页面里的 <meta charset>：
+    # 声明 UTF-8 时直接把 bytes 按 UTF-8 解析，省掉一次整页解码；声明其他编码时在这里解码。
+    # 只有响应头没写编码（或写了无法识别的标签）时才交给解析器，它只看 <meta charset>，没有就按 UTF-8
+    charset = resp.charset_encoding
+    if not charset:
+        return body, True
+    charset = CHARSET_ALIASES.get(charset.strip().lower(), charset)
+    try:
+        codec = codecs.lookup(charset).name
+    except LookupError:
+        logging.warning(f"{url} declares unknown charset '{charset}', falling back to <meta charset> / UTF-8")
+        return body, True
+    if codec != "utf-8":
+        return body.decode(codec, errors="replace"), False
+    return body, False
+
+async def fetch_static_html(session, url, cached=None, timeout=15):
+    # 带上次的 ETag / Last-Modified 做条件请求，页面未变时返回 NOT_MODIFIED
+    headers = {}
+    if cached:
+        if cached.get("etag"):
+            headers["If-None-Match"] = cached["etag"]
+        if cached.get("last_modified"):
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    async def attempt():
+        # 每次尝试单独占用并发名额，退避等待期间让给其他请求
+        async with limited(url), session.stream("GET", url, headers=headers or None, timeout=timeout) as resp:
+            if resp.status_code == 304 and cached:
+                return NOT_MODIFIED, None, False
+            if resp.status_code == 200:
+                validators = {"etag": resp.headers.get("ETag"), "last_modified": resp.headers.get("Last-Modified")}
+                html, sniff = await read_body(resp, url)
+                return html, validators if any(validators.values()) else None, sniff
+            logging.warning(f"Static fetch {url} returned {resp.status_code}")
+            return None, None, False
+
+    try:
+        return await with_retries(attempt, url)
     except Exception as e:
         logging.warning(f"Static fetch failed for {url}: {e}")
-    return None
+    return None, None, False
+
+# Playwright 异步 API 与事件循环绑定：第一次需要时启动浏览器，之后同一事件循环里的
+# 各次 run 都复用它，退出时才关闭；各动态页面在同一个浏览器里用独立 context 并发渲染
+_PW = None
+_PW_BROWSER = None
+
+async def _get_browser():
+    global _PW, _PW_BROWSER
+    async with _PW_LOCK:
+        if _PW_BROWSER is None or not _PW_BROWSER.is_connected():
+            if _PW is None:
+                _PW = await _playwright()().start()
+            _PW_BROWSER = await _PW.firefox.launch(headless=True)
+            logging.info("Playwright browser launched.")
+    return _PW_BROWSER
+
+async def close_browser():
+    global _PW, _PW_BROWSER
+    try:
+        if _PW_BROWSER is not None:
+            await _PW_BROWSER.close()
+        if _PW is not None:
+            await _PW.stop()
+    except Exception as e:
+        logging.warning(f"Closing Playwright failed: {e}")
+    _PW = _PW_BROWSER = None
 
-def fetch_dynamic_html(url, wait_seconds_range=(2, 5)):
+# 解析只需要 HTML：图片 / 字体 / 样式和统计脚本一律拦截，减少页面加载的流量和时间
+BLOCKED_RESOURCE_TYPES = {"image", "font", "media", "stylesheet"}
+BLOCKED_URL_PARTS = ("google-analytics", "googletagmanager", "doubleclick", "facebook.net", "hotjar")
+
+async def _block_assets(route):
+    request = route.request
+    if request.resource_type in BLOCKED_RESOURCE_TYPES or any(p in request.url for p in BLOCKED_URL_PARTS):
+        await route.abort()
+    else:
+        await route.continue_()
+
+async def fetch_dynamic_html(site, timeout_ms=15000):
     if not PLAYWRIGHT_AVAILABLE:
         return None
+    url = site.url
     try:
-        with sync_playwright() as p:
-            browser = p.firefox.launch(headless=True)
-            page = browser.new_page()
-            page.goto(url)
-            time.sleep(random.uniform(*wait_seconds_range))
-            html = page.content()
-            browser.close()
-            return html
+        browser = await _get_browser()
+        ctx = await browser.new_context(viewport={"width": 1280, "height": 800}, device_scale_factor=1)
+        try:
+            await ctx.route("**/*", _block_assets)
+            page = await ctx.new_page()
+            await page.goto(url, wait_until="domcontentloaded")
+            # 商品节点一挂到 DOM 上就取内容，不再固定等待几秒；样式表被拦截，
+            # 元素未必“可见”，所以只等 attached
+            try:
+                await page.wait_for_selector(site.item, state="attached", timeout=timeout_ms)
+                if site.scroll:
+                    # 滚动加载的站点：滚到底部再等网络空闲
+                    await page.evaluate("window.scrollTo(0, document.body.scrollHeight)")
+                    await page.wait_for_load_state("networkidle", timeout=5000)
+            except Exception as e:
+                # 选择器没等到（可能站点改版），退回到等网络空闲，尽量拿到渲染完的页面
+                logging.warning(f"Waiting for listings on {url} failed: {e}")
+                try:
+                    await page.wait_for_load_state("networkidle", timeout=5000)
+                except Exception:
+                    pass
+            return await page.content()
+        finally:
+            await ctx.close()
     except Exception as e:
         logging.error(f"Dynamic fetch failed for {url}: {e}")
         return None
 
-def parse_items_from_html(html, site):
-    soup = BeautifulSoup(html, "html.parser")
+def join_link(base, scheme, href):
+    # 绝对链接和协议相对链接直接拼接，只有真正的相对路径才交给 urljoin 做完整解析
+    if href.startswith(("http://", "https://")):
+        return href
+    if href.startswith("//"):
+        return f"{scheme}:{href}"
+    return urljoin(base, href)
+
+def parse_items_from_html(html, site, sniff=False):
+    # Lexbor 是 C 实现的 HTML5 解析器，选择器匹配也在 C 里完成；
+    # bytes 默认按 UTF-8 解析，sniff=True 时按 <meta charset> 识别编码
+    tree = LexborHTMLParser(html, encoding=sniff)
+    url = site.url
+    scheme = url.partition(":")[0]
+    name_sel, link_sel, price_sel = site.name, site.link, site.price
+    products = tree.css(site.item)
+    if not products:
+        # 一个商品节点都没有：多半是 JS 渲染的空壳，返回 None 让调用方改用浏览器
+        return None
     items = []
-    for product in soup.select(site.get("item", "")):
+    for product in products:
         try:
-            name_el = product.select_one(site.get("name", ""))
-            link_el = product.select_one(site.get("link", ""))
-            price_el = product.select_one(site.get("price", ""))
-            if not name_el or not link_el:
+            name_el = product.css_first(name_sel)
+            if name_el is None:
+                continue
+            name = name_el.text(strip=True)
+            # 品牌过滤并入解析：不匹配的商品不再查找价格 / 链接，也不创建 Item
+            if not brand_match(name):
                 continue
-            name = name_el.get_text(strip=True)
-            price = price_el.get_text(strip=True) if price_el else "Price not listed"
-            href = link_el.get("href") or link_el.get("data-href") or ""
-            link = urljoin(site["url"], href)
-            items.append({"name": name, "price": price, "link": link, "source": site["url"]})
+            link_el = product.css_first(link_sel)
+            if link_el is None:
+                continue
+            price_el = product.css_first(price_sel)
+            price = price_el.text(strip=True) if price_el is not None else "Price not listed"
+            attrs = link_el.attributes
+            href = attrs.get("href") or attrs.get("data-href") or ""
+            link = join_link(url, scheme, href)
+            items.append(Item(name, price, link, url))
         except Exception as e:
-            logging.debug(f"Error parsing product on {site['url']}: {e}")
+            logging.debug(f"Error parsing product on {url}: {e}")
     return items
 
-def fetch_site(site):
-    url = site["url"]
-    logging.info(f"Fetching {url}")
-    html = fetch_static_html(url)
-    if not html or len(html) < 2000:
-        html = fetch_dynamic_html(url)
-    if not html:
-        return []
-    items = parse_items_from_html(html, site)
-    logging.info(f"Found {len(items)} items on {url}")
+# SQLite 缓存，每个站点各一行：
+# http_cache: 每个站点上次的 ETag / Last-Modified，用于条件请求
+# parse_cache: 每个站点上次的页面摘要和解析结果（只含目标品牌）；304 或页面内容没变时直接复用
+# 品牌列表的指纹记在 user_version 里，改了 TARGET_BRANDS 后旧的解析结果整体作废
+BRANDS_FINGERPRINT = int.from_bytes(
+    hashlib.blake2b("\0".join(_BRANDS_LC).encode("utf-8"), digest_size=4).digest(), "little", signed=True
+)
+
+def _init_cache(path):
+    db = sqlite3.connect(path)
+    try:
+        db.execute("CREATE TABLE IF NOT EXISTS http_cache (url TEXT PRIMARY KEY, etag TEXT, last_modified TEXT)")
+        db.execute("CREATE TABLE IF NOT EXISTS parse_cache (url TEXT PRIMARY KEY, digest BLOB NOT NULL, items BLOB NOT NULL)")
+        if db.execute("PRAGMA user_version").fetchone()[0] != BRANDS_FINGERPRINT:
+            db.execute("DELETE FROM parse_cache")
+            db.execute(f"PRAGMA user_version = {BRANDS_FINGERPRINT}")
+            db.commit()
+        return db
+    except Exception:
+        db.close()
+        raise
+
+def open_cache():
+    # 缓存只是优化，打不开也不能影响抓取：文件损坏就删掉重建；
+    # 被锁或无法读写时不动文件，这次 run 改用内存库（相当于没有缓存）
+    try:
+        return _init_cache(CACHE_DB)
+    except sqlite3.OperationalError as e:
+        logging.warning(f"Cache {CACHE_DB} unavailable, running without it: {e}")
+    except sqlite3.Error as e:
+        logging.warning(f"Cache {CACHE_DB} is corrupt, recreating: {e}")
+        try:
+            os.remove(CACHE_DB)
+            return _init_cache(CACHE_DB)
+        except (OSError, sqlite3.Error) as e:
+            logging.warning(f"Recreating {CACHE_DB} failed, running without cache: {e}")
+    return _init_cache(":memory:")
+
+def load_validators(db, url):
+    # 只有存在对应解析结果时才做条件请求，否则 304 后无内容可用
+    try:
+        row = db.execute(
+            "SELECT h.etag, h.last_modified FROM http_cache h JOIN parse_cache p ON p.url = h.url WHERE h.url = ?", (url,)
+        ).fetchone()
+        return {"etag": row[0], "last_modified": row[1]} if row else None
+    except Exception as e:
+        logging.warning(f"HTTP cache lookup failed for {url}: {e}")
+        return None
+
+def store_validators(db, url, validators):
+    try:
+        if validators:
+            db.execute(
+                "INSERT OR REPLACE INTO http_cache (url, etag, last_modified) VALUES (?, ?, ?)",
+                (url, validators["etag"], validators["last_modified"]),
+            )
+        else:
+            db.execute("DELETE FROM http_cache WHERE url = ?", (url,))
+    except Exception as e:
+        logging.warning(f"HTTP cache store failed for {url}: {e}")
+
+def html_digest(html, site, sniff=False):
+    h = hashlib.blake2b(digest_size=16)
+    for sel in (site.item, site.name, site.price, site.link):
+        h.update(sel.encode("utf-8") + b"\0")
+    h.update(b"\1" if sniff else b"\0")
+    h.update(html if isinstance(html, bytes) else html.encode("utf-8"))
+    return h.digest()
+
+def load_parsed(db, url, digest=None):
+    # digest 为 None 时取该站点最近一次的解析结果（用于 304）
+    try:
+        if digest is None:
+            row = db.execute("SELECT items FROM parse_cache WHERE url = ?", (url,)).fetchone()
+        else:
+            row = db.execute("SELECT items FROM parse_cache WHERE url = ? AND digest = ?", (url, digest)).fetchone()
+        return [Item(*i) for i in orjson.loads(row[0])] if row else None
+    except Exception as e:
+        logging.warning(f"Parse cache lookup failed for {url}: {e}")
+        return None
+
+def store_parsed(db, url, digest, items):
+    try:
+        db.execute("INSERT OR REPLACE INTO parse_cache (url, digest, items) VALUES (?, ?, ?)", (url, digest, orjson.dumps(items, default=tuple)))
+    except Exception as e:
+        logging.warning(f"Parse cache store failed for {url}: {e}")
+
+# 解析是 CPU 密集的，大页面放到进程池里绕开 GIL；小页面进程间传输反而更贵，
+# 放到线程里解析，避免卡住事件循环上其他站点的下载
+# 进程数默认取 CPU 核数，但同时在解析的页面不会多于站点数，再多的进程只是空占内存；可用 PARSE_WORKERS 调整
+PARSE_WORKERS = env_workers("PARSE_WORKERS", min(os.cpu_count() or 1, len(SITES)))
+_PARSE_POOL = ProcessPoolExecutor(max_workers=PARSE_WORKERS)
+PARSE_POOL_MIN_BYTES = 50000
+
+async def parse_html(html, site, sniff=False):
+    if len(html) < PARSE_POOL_MIN_BYTES:
+        return await asyncio.to_thread(parse_items_from_html, html, site, sniff)
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_PARSE_POOL, parse_items_from_html, html, site, sniff)
+
+async def fetch_api_json(session, site, timeout=15):
+    api = site.api
+
+    async def attempt():
+        async with limited(api):
+            resp = await session.get(api, headers=dict(site.api_headers or ()), timeout=timeout)
+        if resp.status_code == 200:
+            return resp.content
+        logging.warning(f"API fetch {api} returned {resp.status_code}")
+        return None
+
+    try:
+        body = await with_retries(attempt, api)
+    except Exception as e:
+        logging.warning(f"API fetch failed for {api}: {e}")
+        return None
+    if body is None:
+        return None
+    # JSON 解析放在重试之外，也不占用并发名额
+    try:
+        return orjson.loads(body)
+    except orjson.JSONDecodeError as e:
+        logging.warning(f"API response from {api} is not valid JSON: {e}")
+        return None
+
+def _json_get(obj, path):
+    # 按 "a.0.b" 形式的路径取值，取不到返回 None
+    for key in path.split(".") if path else []:
+        try:
+            obj = obj[int(key)] if isinstance(obj, list) else obj[key]
+        except (KeyError, IndexError, TypeError, ValueError):
+            return None
+    return obj
+
+def parse_items_from_json(data, site):
+    fields = site.api_fields
+    base = site.api_link_base or site.url
+    scheme = base.partition(":")[0]
+    products = _json_get(data, site.json_path)
+    if not isinstance(products, list):
+        # 取不到商品数组（错误响应或接口改版）：返回 None，让调用方退回 HTML 抓取
+        return None
+    items = []
+    for product in products:
+        name = _json_get(product, fields.name)
+        if not name or not brand_match(str(name)):
+            continue
+        href = _json_get(product, fields.link)
+        if not href:
+            continue
+        price = _json_get(product, fields.price) or "Price not listed"
+        items.append(Item(str(name).strip(), str(price), join_link(base, scheme, str(href)), site.url))
     return items
 
+async def parse_cached(cache, url, html, site, sniff=False):
+    # 页面内容（含选择器）没变就复用上次的解析结果
+    digest = html_digest(html, site, sniff)
+    items = load_parsed(cache, url, digest)
+    if items is None:
+        items = await parse_html(html, site, sniff)
+        if items is not None:
+            store_parsed(cache, url, digest, items)
+    return items
+
+async def fetch_site(session, site, cache):
+    url = site.url
+    logging.info(f"Fetching {url}")
+    # 有 JSON 接口的站点直接取结构化数据，失败或响应里没有商品数组时再走 HTML / Playwright
+    if site.api:
+        data = await fetch_api_json(session, site)
+        items = parse_items_from_json(data, site) if data is not None else None
+        if items is not None:
+            logging.info(f"Found {len(items)} items on {url} (api)")
+            return items
+        logging.warning(f"API for {url} gave no listing, falling back to HTML")
+    # 已知需要 JS 渲染的站点直接用浏览器；其他站点先取静态页，
+    # 静态页上一个商品节点都没有时才升级为浏览器渲染
+    if not site.dynamic:
+        html, validators, sniff = await fetch_static_html(session, url, load_validators(cache, url))
+        if html is NOT_MODIFIED:
+            items = load_parsed(cache, url)
+            if items is not None:
+                logging.info(f"{url} not modified, reusing {len(items)} cached items")
+                return items
+            html, validators, sniff = await fetch_static_html(session, url)
+        items = await parse_cached(cache, url, html, site, sniff) if html else None
+        if items is not None:
+            logging.info(f"Found {len(items)} items on {url}")
+            store_validators(cache, url, validators)
+            return items
+    # 动态渲染的结果与静态页的 ETag 无关，不做条件请求
+    store_validators(cache, url, None)
+    async with _DYNAMIC_SEM, limited(url):
+        html = await fetch_dynamic_html(site)
+    items = await parse_cached(cache, url, html, site) if html else None
+    logging.info(f"Found {len(items or [])} items on {url} (rendered)")
+    return items or []
+
 # ======= 数据处理 =======
-def filter_by_brand(items):
-    brands = [b.lower() for b in TARGET_BRANDS]
-    return [i for i in items if any(b in i["name"].lower() for b in brands)]
+def brand_match(name):
+    name_lc = name.lower()
+    if AHOCORASICK_AVAILABLE:
+        return next(_AC.iter(name_lc), None) is not None
+    return BRAND_RE.search(name_lc) is not None
+
+# 已通知商品的指纹集合：固定大小位图，约 14 bit/条，误判率由 error_rate 控制
+class BloomFilter:
+    _HEADER = struct.Struct("<QI")
+
+    def __init__(self, capacity=100000, error_rate=0.001, num_bits=None, num_hashes=None, bits=None):
+        self.num_bits = num_bits or math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = num_hashes or max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bits if bits is not None else bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, key):
+        # key 为 sha1 摘要，前后两段作为双重哈希的种子
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        return ((h1 + n * h2) % self.num_bits for n in range(self.num_hashes))
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key):
+        for p in self._positions(key):
+            self.bits[p >> 3] |= 1 << (p & 7)
+
+    def to_bytes(self):
+        return self._HEADER.pack(self.num_bits, self.num_hashes) + self.bits
+
+    @classmethod
+    def from_bytes(cls, data):
+        num_bits, num_hashes = cls._HEADER.unpack_from(data)
+        return cls(num_bits=num_bits, num_hashes=num_hashes, bits=bytearray(data[cls._HEADER.size:]))
+
+# 布隆过滤器不能删除单条记录，老化靠两代轮换：当前代满 SEEN_MAX_AGE_DAYS 天后降为上一代，
+# 原来的上一代整体丢弃。仍在架上的商品每次出现都续到当前代，不会被重复通知；
+# 一条记录在最后一次出现后至少保留 SEEN_MAX_AGE_DAYS 天、最多两倍，之后被淘汰，过滤器也不会越积越满
+SEEN_MAX_AGE_DAYS = 90
+
+class SeenSet:
+    _HEADER = struct.Struct("<4sdI")
+    _MAGIC = b"SEEN"
+
+    def __init__(self, started=None, current=None, previous=None):
+        self.started = started or time.time()
+        self.current = current or BloomFilter()
+        self.previous = previous or BloomFilter()
+        self.dirty = False
+
+    def __contains__(self, key):
+        return key in self.current or key in self.previous
+
+    def add(self, key):
+        if key not in self.current:
+            self.current.add(key)
+            self.dirty = True
+
+    def rotate(self, now):
+        if now - self.started >= SEEN_MAX_AGE_DAYS * 86400:
+            self.previous, self.current, self.started = self.current, BloomFilter(), now
+            self.dirty = True
+
+    def to_bytes(self):
+        current = self.current.to_bytes()
+        return self._HEADER.pack(self._MAGIC, self.started, len(current)) + current + self.previous.to_bytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        if not data.startswith(cls._MAGIC):
+            # 旧格式：单个过滤器，作为当前代从现在开始计时
+            return cls(current=BloomFilter.from_bytes(data))
+        _, started, size = cls._HEADER.unpack_from(data)
+        offset = cls._HEADER.size
+        current = BloomFilter.from_bytes(data[offset:offset + size])
+        previous = BloomFilter.from_bytes(data[offset + size:])
+        return cls(started, current, previous)
+
+def load_seen():
+    seen = SeenSet()
+    if os.path.exists(SEEN_FILE):
+        try:
+            with open(SEEN_FILE, "rb") as f:
+                seen = SeenSet.from_bytes(f.read())
+        except Exception as e:
+            logging.warning(f"Failed to load seen filter, starting fresh: {e}")
+    elif os.path.exists(LEGACY_ITEMS_FILE):
+        # 从旧版本升级：用上次的商品列表初始化过滤器，避免首次运行把已通知过的商品再发一遍
+        try:
+            with open(LEGACY_ITEMS_FILE, "rb") as f:
+                legacy = orjson.loads(f.read())
+            mark_seen((Item(i.get("name", ""), i.get("price", ""), i.get("link", ""), i.get("source", "")) for i in legacy), seen)
+            logging.info(f"Seeded seen filter from {LEGACY_ITEMS_FILE} ({len(legacy)} items).")
+        except Exception as e:
+            logging.warning(f"Failed to migrate {LEGACY_ITEMS_FILE}: {e}")
+    seen.rotate(time.time())
+    return seen
 
-def load_previous():
-    if not os.path.exists(DATA_FILE):
-        return []
+def save_seen(seen):
     try:
-        with open(DATA_FILE, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return []
+        with open(SEEN_FILE, "wb") as f:
+            f.write(seen.to_bytes())
+    except Exception as e:
+        logging.error(f"Failed to save seen filter: {e}")
 
-def save_current(items):
+_NON_WORD = re.compile(r"[\W_]+")
+
+def item_key(item):
+    # 名称归一化 + 链接路径，忽略查询参数和来源站点的差异
+    name = _NON_WORD.sub(" ", item.name.lower()).strip()
+    path = urlparse(item.link).path.rstrip("/")
+    return hashlib.sha1(f"{name}|{path}".encode("utf-8")).digest()
+
+def append_history(items):
+    # 只追加本次的新商品，一行一条 JSON，不再整体重写历史文件
     try:
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump(items, f, ensure_ascii=False, indent=2)
+        with open(ITEMS_FILE, "ab") as f:
+            f.write(b"".join(orjson.dumps(i._asdict(), option=orjson.OPT_APPEND_NEWLINE) for i in items))
     except Exception as e:
-        logging.error(f"Failed to save current data: {e}")
+        logging.error(f"Failed to append item history: {e}")
 
-def find_new_items(current, previous):
-    prev_links = {i.get("link") for i in previous}
-    return [i for i in current if i.get("link") not in prev_links]
+def find_new_items(current, seen):
+    # 已见过的写入当前代续期；新商品只返回，等邮件发送成功后再由 mark_seen 记下
+    new_items, batch = [], set()
+    for i in current:
+        key = item_key(i)
+        if key in seen:
+            seen.add(key)
+        elif key not in batch:
+            batch.add(key)
+            new_items.append(i)
+    return new_items
+
+def mark_seen(items, seen):
+    for i in items:
+        seen.add(item_key(i))
 
 # ======= 邮件通知 =======
-def send_email(new_items):
+# SMTP 连接按需建立，在整个进程内复用（调度模式下跨多次 run）；每次发送前先 NOOP 探活，断了就重连
+class SMTPPool:
+    def __init__(self, server, port, user, password):
+        self.server = server
+        self.port = port
+        self.user = user
+        self.password = password
+        self.conn = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _connect(self):
+        # 465 为隐式 TLS，省掉 STARTTLS 的一次往返；其他端口走 STARTTLS
+        if self.port == 465:
+            s = smtplib.SMTP_SSL(self.server, self.port)
+        else:
+            s = smtplib.SMTP(self.server, self.port)
+            s.starttls()
+        s.login(self.user, self.password)
+        return s
+
+    def _alive(self):
+        if self.conn is None:
+            return False
+        try:
+            return self.conn.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def send(self, message, to_addrs):
+        if not self._alive():
+            self.close()
+            self.conn = self._connect()
+        self.conn.sendmail(self.user, to_addrs, message)
+
+    def close(self):
+        if self.conn is not None:
+            try:
+                self.conn.quit()
+            except Exception:
+                pass
+            self.conn = None
+
+# 邮件中不变的部分只准备一次：HTML 外框是带 {rows} 占位的模板；固定头部预先按 policy 解析成头部对象，
+# 每封邮件用 set_raw 直接挂上，省掉每次的头部解析
+HTML_TEMPLATE = "<h3>🎷 New Listings</h3><table border='1'>{rows}</table>"
+_BASE_HEADERS = [
+    policy.default.header_store_parse(name, value)
+    for name, value in (
+        ("From", f"SaxBot <{EMAIL_USER}>"),
+        ("To", EMAIL_USER or ""),
+        ("Subject", "🎷 New Saxophone Listings"),
+    )
+]
+
+def send_email(new_items, smtp, recipients):
     if not EMAIL_USER or not EMAIL_PASS:
         logging.error("EMAIL_USER or EMAIL_PASS missing.")
-        return
-    msg = MIMEMultipart("alternative")
-    msg["From"] = f"SaxBot <{EMAIL_USER}>"
-    msg["To"] = RECIPIENT_EMAIL
-    msg["Subject"] = "🎷 New Saxophone Listings"
+        return False
+    recipients = list(recipients)
+    if not recipients:
+        logging.error("No recipients configured.")
+        return False
+    msg = EmailMessage()
+    for name, value in _BASE_HEADERS:
+        msg.set_raw(name, value)
 
     if new_items:
         rows = "".join(
-            f"<tr><td><a href='{i['link']}'>{i['name']}</a></td><td>{i['price']}</td><td>{i['source']}</td></tr>"
+            f"<tr><td><a href='{i.link}'>{i.name}</a></td><td>{i.price}</td><td>{i.source}</td></tr>"
             for i in new_items
         )
-        html = f"<h3>🎷 New Listings</h3><table border='1'>{rows}</table>"
+        html = HTML_TEMPLATE.format(rows=rows)
+        text = "\n".join(f"{i.name} - {i.price} - {i.link}" for i in new_items)
     else:
         html = "<p>No new listings this time.</p>"
+        text = "No new listings this time."
 
-    msg.attach(MIMEText(html, "html"))
+    msg.set_content(text)
+    msg.add_alternative(html, subtype="html")
 
     try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as s:
-            s.starttls()
-            s.login(EMAIL_USER, EMAIL_PASS)
-            s.sendmail(EMAIL_USER, RECIPIENT_EMAIL, msg.as_string())
-        logging.info(f"Email sent to {RECIPIENT_EMAIL} ({len(new_items)} new items).")
+        data = msg.as_bytes()
+        for start in range(0, len(recipients), RECIPIENT_BATCH):
+            smtp.send(data, recipients[start:start + RECIPIENT_BATCH])
+        logging.info(f"Email sent to {len(recipients)} recipient(s) ({len(new_items)} new items).")
+        return True
     except Exception as e:
         logging.error(f"Email send failed: {e}")
+        return False
 
 # ======= 主流程 =======
-def run_once():
+async def run_once_async(smtp):
     logging.info("=== Run started ===")
     all_items = []
-    with ThreadPoolExecutor(max_workers=4) as ex:
-        futures = [ex.submit(fetch_site, s) for s in SITES]
-        for f in as_completed(futures):
-            all_items.extend(f.result() or [])
-    filtered = filter_by_brand(all_items)
-    previous = load_previous()
-    new_items = find_new_items(filtered, previous)
-    if new_items:
-        save_current(filtered)
-        send_email(new_items)
+    reset_loop_state()
+    cache = open_cache()
+    try:
+        session = get_session()
+        results = await asyncio.gather(*(fetch_site(session, s, cache) for s in SITES))
+        try:
+            cache.commit()
+        except sqlite3.Error as e:
+            logging.warning(f"Saving cache failed: {e}")
+    finally:
+        cache.close()
+    for items in results:
+        all_items.extend(items or [])
+    seen = load_seen()
+    new_items = find_new_items(all_items, seen)
+    # 发送失败的商品不记为已见，下次 run 会再次通知
+    if new_items and send_email(new_items, smtp, RECIPIENTS):
+        mark_seen(new_items, seen)
+        append_history(new_items)
+    if seen.dirty:
+        save_seen(seen)
     logging.info("=== Run finished ===\n")
 
+def run_once(smtp):
+    async def once():
+        try:
+            await run_once_async(smtp)
+        finally:
+            await close_resources()
+    asyncio.run(once())
+
 # ======= 调度模式 =======
-def start_scheduler():
+async def run_scheduler(smtp):
+    # AsyncIOScheduler 让每次 run 都跑在同一个事件循环里，会话和浏览器可以一直复用
+    scheduler = _asyncio_scheduler()()
+    scheduler.add_job(run_once_async, "interval", args=[smtp], minutes=INTERVAL_MINUTES)
+    scheduler.start()
+    logging.info(f"Scheduler started every {INTERVAL_MINUTES} minutes.")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        scheduler.shutdown()
+        await close_resources()
+
+def start_scheduler(smtp):
     if not APS_AVAILABLE:
         logging.error("APScheduler not installed.")
         return
-    scheduler = BackgroundScheduler()
-    scheduler.add_job(run_once, "interval", minutes=INTERVAL_MINUTES)
-    scheduler.start()
-    logging.info(f"Scheduler started every {INTERVAL_MINUTES} minutes.")
     try:
-        while True:
-            time.sleep(3600)
+        asyncio.run(run_scheduler(smtp))
     except KeyboardInterrupt:
-        scheduler.shutdown()
+        pass
 
 # ======= CLI =======
 if __name__ == "__main__":
     import sys
     mode = sys.argv[1] if len(sys.argv) > 1 else "once"
-    if mode == "schedule":
-        start_scheduler()
-    else:
-        run_once()
+    with SMTPPool(SMTP_SERVER, SMTP_PORT, EMAIL_USER, EMAIL_PASS) as smtp:
+        if mode == "schedule":
+            start_scheduler(smtp)
+        else:
+            run_once(smtp)
 
 
 